@@ -0,0 +1,725 @@
+"""
+Capture and decode pipeline shared by qr_scanner.py and qr_scanner_system.py.
+The scanners differ only in how they open the camera and report results.
+"""
+
+import cv2
+import numpy as np
+import time
+import threading
+import functools
+import collections
+import queue
+from pyzbar import pyzbar
+from pyzbar.locations import Rect
+from pyzbar.pyzbar import ZBarSymbol
+
+try:
+    from picamera2 import MappedArray, Picamera2
+except ImportError:
+    Picamera2 = None  # Fall back to cv2.VideoCapture
+
+try:
+    import zbar
+except ImportError:
+    zbar = None  # Fall back to pyzbar for every scan
+
+
+def _aligned_empty(shape, align=64):
+    """
+    Allocate a C-contiguous uint8 array whose data starts on an align-byte boundary.
+    
+    Args:
+        shape (tuple): Array shape
+        align (int): Required address alignment in bytes
+        
+    Returns:
+        numpy.ndarray: Uninitialized array view into an over-allocated buffer
+    """
+    size = int(np.prod(shape))
+    raw = np.empty(size + align, dtype=np.uint8)
+    offset = -raw.ctypes.data % align
+    return raw[offset:offset + size].reshape(shape)
+
+
+def _points_rect(points):
+    """
+    Bounding rect of QR corner points from cv2.QRCodeDetector.
+    
+    Args:
+        points: Corner points, last axis (x, y)
+        
+    Returns:
+        Rect: Integer bounding rectangle
+    """
+    xs, ys = points[..., 0], points[..., 1]
+    return Rect(int(xs.min()), int(ys.min()),
+                int(xs.max() - xs.min()), int(ys.max() - ys.min()))
+
+
+# Only look for QR codes; skips zbar's linear barcode scanners
+QR_SYMBOLS = [ZBarSymbol.QRCODE]
+
+# One decoded QR code (data is raw bytes); a tuple is much cheaper to build than a dict
+QRHit = collections.namedtuple('QRHit', 'data type rect')
+
+
+class CameraReader(threading.Thread):
+    """Background thread that keeps only the most recent camera frame."""
+
+    # A grab() faster than this was served from an already-queued buffer
+    STALE_GRAB_SECONDS = 0.004
+    MAX_FLUSH_GRABS = 3
+    
+    def __init__(self, cap, flush=False):
+        """
+        Initialize the reader thread.
+        
+        Args:
+            cap: Opened cv2.VideoCapture to read frames from
+            flush (bool): Drop queued frames that grab() returns immediately
+        """
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.flush = flush
+        self.lock = threading.Lock()
+        self.ret = False
+        self.frame = None
+        self.new = threading.Event()
+        self._running = True
+    
+    def run(self):
+        """Continuously read frames, overwriting the single frame slot."""
+        while self._running:
+            # Every published frame is retrieved (converted) here, even if the
+            # decoder never takes it; only grab_fresh()'s stale buffers skip it.
+            # retrieve() stays on this thread: VideoCapture isn't thread-safe
+            frame = None
+            try:
+                ret = self.grab_fresh() if self.flush else self.cap.grab()
+                if ret:
+                    ret, frame = self.cap.retrieve()
+            except Exception as e:
+                # Publish a failed read so the main loop's failure path runs
+                print(f"Error reading frame: {e}")
+                ret, frame = False, None
+            with self.lock:
+                self.ret = ret
+                self.frame = frame
+                self.new.set()
+            if not ret:
+                # Avoid spinning on a camera that keeps failing
+                time.sleep(0.1)
+    
+    def grab_fresh(self):
+        """
+        Grab until a frame comes from the sensor rather than the driver queue.
+        
+        Many V4L2 drivers ignore CAP_PROP_BUFFERSIZE and keep several frames
+        queued; those come back from grab() at once, while a fresh frame makes
+        grab() wait. Queued frames are dropped without being converted.
+        
+        Returns:
+            bool: True if a frame was grabbed
+        """
+        for _ in range(self.MAX_FLUSH_GRABS + 1):
+            start = time.monotonic()
+            ret = self.cap.grab()
+            if not ret or time.monotonic() - start > self.STALE_GRAB_SECONDS:
+                break
+        return ret
+    
+    def take(self, timeout):
+        """
+        Pop the newest frame published since the last call.
+        
+        Args:
+            timeout (float): Seconds to wait for a new frame
+            
+        Returns:
+            tuple: (ret, frame), or None if no new frame arrived in time
+        """
+        if not self.new.wait(timeout):
+            return None
+        # Clear and read under the same lock the reader publishes with, so
+        # a frame is never handed out twice
+        with self.lock:
+            self.new.clear()
+            ret, frame = self.ret, self.frame
+            self.frame = None
+        return ret, frame
+    
+    def stop(self):
+        """Ask the reader loop to exit after the current read."""
+        self._running = False
+
+
+class Picamera2Capture:
+    """cv2.VideoCapture-style wrapper that yields the luma plane from picamera2."""
+
+    def __init__(self, width, height, buffer_count=2):
+        """
+        Configure and start the camera in YUV420.
+        
+        Args:
+            width (int): Frame width
+            height (int): Frame height
+            buffer_count (int): Buffers the camera cycles through
+        """
+        self.width = width
+        self.height = height
+        self.array = None
+        self.picam2 = Picamera2()
+        try:
+            config = self.picam2.create_video_configuration(
+                main={"size": (width, height), "format": "YUV420"}, buffer_count=buffer_count)
+            self.picam2.configure(config)
+            self.picam2.start()
+        except Exception:
+            # Otherwise the camera stays acquired and the OpenCV fallback can't open it
+            self.picam2.close()
+            raise
+    
+    def isOpened(self):
+        """Report the camera as open; construction fails otherwise."""
+        return True
+    
+    def grab(self):
+        """Capture the next frame, copying only its luma plane out of the DMA buffer."""
+        with self.picam2.captured_request() as request:
+            with MappedArray(request, "main") as mapped:
+                # YUV420 is planar: the first `height` rows are the Y plane;
+                # chroma is never copied and the buffer goes straight back
+                self.array = mapped.array[:self.height, :self.width].copy()
+        return True
+    
+    def retrieve(self):
+        """Return the luma plane of the last grabbed frame."""
+        return True, self.array
+    
+    def read(self):
+        """Grab and retrieve in one call."""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+    
+    def release(self):
+        """Stop and close the camera."""
+        self.picam2.stop()
+        self.picam2.close()
+
+
+class DecodeWorker(threading.Thread):
+    """Background thread that decodes the frames published by a CameraReader."""
+
+    def __init__(self, reader, decode, target_fps=None):
+        """
+        Initialize the decoder thread.
+        
+        Args:
+            reader (CameraReader): Source of frames
+            decode: Callable turning a frame into a list of QR code results
+            target_fps (float): Cap on decodes per second (None to run flat out)
+        """
+        super().__init__(daemon=True)
+        self.reader = reader
+        self.decode = decode
+        self.period = 1.0 / target_fps if target_fps else 0.0
+        self.results = queue.Queue(maxsize=1)
+        self._running = True
+    
+    def run(self):
+        """Decode each fresh frame and pass (ok, qr_codes) to the main thread."""
+        while self._running:
+            latest = self.reader.take(0.5)
+            if latest is None:
+                continue
+            ret, frame = latest
+            start = time.monotonic()
+            
+            # Startup verified a real frame, so `ret` alone is trusted here
+            ok = ret
+            try:
+                # Materialize here so decoding stays on this thread
+                qr_codes = list(self.decode(frame)) if ok else []
+            except Exception as e:
+                print(f"Error decoding QR codes: {e}")
+                qr_codes = []
+            
+            # Wait for the consumer rather than drop results
+            while self._running:
+                try:
+                    self.results.put((ok, qr_codes), timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+            
+            # Paced by frame arrival; only sleep off what's left of a set period
+            remaining = self.period - (time.monotonic() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+    
+    def stop(self):
+        """Ask the decoder loop to exit."""
+        self._running = False
+
+
+class QRScannerBase:
+    def __init__(self, camera_index=0):
+        """
+        Initialize the QR scanner with camera.
+        
+        Args:
+            camera_index (int): Camera index (usually 0 for RPi camera)
+        """
+        self.camera_index = camera_index
+        self.cap = None
+        self.reader = None
+        self.decoder = None
+        self.frame_width = 0
+        self.frame_height = 0
+        self.gray_buf = None  # Reused output of every gray conversion
+        self.raw_yuyv = False  # Frames arrive as unconverted YUYV
+        self.last_qr_hash = None
+        self.last_qr_time_ns = 0
+        self.debounce_ns = 2_000_000_000  # Prevent duplicate reads within 2 seconds
+        self.max_results = 1  # QR codes reported per frame
+        self.target_fps = None  # Optional cap on decodes per second
+        self.downscale_min_width = 320  # Scan frames this wide at half size
+        self.full_res_every = 10  # Full-size scan after this many missed frames
+        self.missed_frames = 0
+        self.last_rect = None  # Where the last reported code was, for tracking
+        
+        # Direct zbar bindings let one scanner be reused across frames
+        self.zbar_scanner = None
+        if zbar is not None:
+            self.zbar_scanner = zbar.ImageScanner()
+            self.zbar_scanner.parse_config('disable')
+            self.zbar_scanner.parse_config('qrcode.enable')
+        
+        # Fast native locator/decoder; pyzbar only scans what it can't read
+        self.detector = cv2.QRCodeDetector() if hasattr(cv2, 'QRCodeDetector') else None
+        self.roi_margin = 16  # Pixels kept around the located code
+        self.clahe = cv2.createCLAHE(clipLimit=2.0)
+        self.close_kernel = np.ones((3, 3), np.uint8)
+        
+        # Motion gate: skip decoding while the scene is static
+        self.motion_threshold = 12  # Per-pixel change that counts as motion
+        self.motion_min_fraction = 0.01  # Share of changed pixels to decode
+        self.max_static_frames = 15  # Force a decode after this many skips
+        self.prev_thumb = None
+        self.static_frames = 0
+    def start_picamera2(self, width, height, buffer_count=2):
+        """
+        Initialize the camera through picamera2, if available.
+        
+        Args:
+            width (int): Frame width
+            height (int): Frame height
+            buffer_count (int): Buffers the camera cycles through
+        """
+        if Picamera2 is None:
+            return False
+        
+        try:
+            # Recovery restarts land here too; free the old camera first
+            if self.cap:
+                self.cap.release()
+                self.cap = None
+            
+            self.cap = Picamera2Capture(width, height, buffer_count=buffer_count)
+            self.frame_width, self.frame_height = width, height
+            print("Camera initialized successfully (picamera2)")
+            return True
+            
+        except Exception as e:
+            print(f"picamera2 unavailable, falling back to OpenCV: {e}")
+            self.cap = None
+            return False
+    
+    def start_camera(self):
+        """
+        Open the camera; provided by each scanner.
+        
+        Returns:
+            bool: True if a camera delivers frames
+        """
+        raise NotImplementedError
+    
+    def frame_to_gray(self, frame):
+        """
+        Extract the luma plane from a captured frame.
+        
+        Args:
+            frame: BGR, GRAY8, or raw YUYV frame (RGB conversion disabled)
+            
+        Returns:
+            numpy.ndarray: Single-channel 8-bit grayscale image
+        """
+        raw = self.raw_yuyv and frame.size == self.frame_width * self.frame_height * 2
+        if not raw and frame.ndim == 2:
+            # GRAY8 and picamera2 frames are already luma
+            return frame
+        
+        # Conversions write into one buffer allocated once per frame size
+        shape = (self.frame_height, self.frame_width) if raw else frame.shape[:2]
+        if self.gray_buf is None or self.gray_buf.shape != shape:
+            # Cache-line aligned start; rows stay contiguous so zbar and
+            # cv2 take it without another copy
+            self.gray_buf = _aligned_empty(shape)
+        
+        if raw:
+            # Y is byte 0 of each 2-byte pixel pair
+            np.copyto(self.gray_buf, frame.reshape(shape + (2,))[:, :, 0])
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray_buf)
+        return self.gray_buf
+    
+    def crop_to_points(self, gray, points):
+        """
+        Crop a grayscale image around detected QR corner points.
+        
+        Args:
+            gray: Grayscale image the points refer to
+            points: Corner points returned by cv2.QRCodeDetector.detect
+            
+        Returns:
+            tuple: (x offset, y offset, cropped image)
+        """
+        m = self.roi_margin
+        xs = points[..., 0]
+        ys = points[..., 1]
+        x1 = max(int(xs.min()) - m, 0)
+        y1 = max(int(ys.min()) - m, 0)
+        x2 = min(int(xs.max()) + m, gray.shape[1])
+        y2 = min(int(ys.max()) + m, gray.shape[0])
+        if x2 <= x1 or y2 <= y1:
+            return 0, 0, gray
+        return x1, y1, gray[y1:y2, x1:x2]
+    
+    def scene_changed(self, gray):
+        """
+        Check whether the frame differs enough from the last decoded one.
+        
+        Args:
+            gray: Full-size grayscale frame
+            
+        Returns:
+            bool: True if the frame should be decoded, False if it is static
+        """
+        h, w = gray.shape
+        thumb = cv2.resize(gray, (max(w // 8, 1), max(h // 8, 1)),
+                           interpolation=cv2.INTER_AREA)
+        
+        if (self.prev_thumb is not None and self.prev_thumb.shape == thumb.shape and
+                self.static_frames < self.max_static_frames):
+            diff = cv2.absdiff(thumb, self.prev_thumb)
+            _, changed = cv2.threshold(diff, self.motion_threshold, 1, cv2.THRESH_BINARY)
+            if cv2.countNonZero(changed) < self.motion_min_fraction * thumb.size:
+                self.static_frames += 1
+                return False
+        
+        self.prev_thumb = thumb
+        self.static_frames = 0
+        return True
+    
+    def scan_qr(self, image):
+        """
+        Run zbar on a grayscale image, restricted to QR codes.
+        
+        With the zbar bindings installed the pixels are handed to one reused
+        scanner; pyzbar instead creates and configures a scanner per call.
+        
+        Args:
+            image: Grayscale image
+            
+        Returns:
+            list: Decoded codes with data, type and rect
+        """
+        if self.zbar_scanner is None:
+            return pyzbar.decode(image, symbols=QR_SYMBOLS)
+        
+        h, w = image.shape
+        zimg = zbar.Image(w, h, 'Y800', image.tobytes())
+        self.zbar_scanner.scan(zimg)
+        qr_codes = []
+        for symbol in zimg.symbols:
+            data = symbol.data
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            xs = [x for x, _ in symbol.location]
+            ys = [y for _, y in symbol.location]
+            rect = Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+            qr_codes.append(QRHit(data, str(symbol.type), rect))
+        return qr_codes
+    
+    def decode_binarized(self, region):
+        """
+        Retry pyzbar on thresholded copies of a region.
+        
+        A global Otsu threshold costs one histogram pass and suits evenly lit
+        codes; local thresholding, which rescues unevenly lit or low-contrast
+        codes, only runs if that fails. At most two extra decodes are attempted;
+        light-on-dark codes are left to decode_enhanced's inverted pass.
+        
+        Args:
+            region: Grayscale image that failed to decode
+            
+        Returns:
+            list: pyzbar results, empty if every attempt fails
+        """
+        _, binary = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        qr_codes = self.scan_qr(binary)
+        if qr_codes:
+            return qr_codes
+        
+        binary = cv2.adaptiveThreshold(region, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY, 15, 4)
+        return self.scan_qr(binary)
+    
+    def decode_enhanced(self, region):
+        """
+        Retry pyzbar on progressively enhanced copies of a region.
+        
+        Only used when the locator found a code that pyzbar could not read,
+        so the extra processing is never paid on ordinary frames.
+        
+        Args:
+            region: Grayscale crop around the located code
+            
+        Returns:
+            list: pyzbar results from the first enhancement that decodes
+        """
+        enhancements = [
+            lambda img: self.clahe.apply(img),
+            cv2.bitwise_not,
+            lambda img: cv2.morphologyEx(img, cv2.MORPH_CLOSE, self.close_kernel),
+        ]
+        for enhance in enhancements:
+            qr_codes = self.scan_qr(enhance(region))
+            if qr_codes:
+                return qr_codes
+        
+        # Last resort: enlarge small codes, then map rects back
+        big = cv2.resize(region, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+        return [qr_code._replace(rect=Rect(*(v // 2 for v in qr_code.rect)))
+                for qr_code in self.scan_qr(big)]
+    
+    def decode_qr_codes(self, frame, max_results=None):
+        """
+        Decode QR codes from the given frame.
+        
+        Args:
+            frame: OpenCV frame/image
+            max_results (int): Stop after this many codes (None for all)
+            
+        Yields:
+            QRHit: Decoded QR code data, type and rect
+        """
+        # pyzbar only needs luma
+        gray = self.frame_to_gray(frame)
+        
+        # Nothing new to find in a frame that matches the last decoded one
+        if not self.scene_changed(gray):
+            # A miss still stands on an unchanged frame, so keep counting
+            # toward the periodic full-size scan
+            if self.missed_frames:
+                self.missed_frames += 1
+            return
+        
+        # A code read last frame is most likely still in the same place; try a
+        # full-size crop around it before running the locator on the whole frame.
+        # The crop holds one code, so this only serves single-code scans
+        if self.last_rect is not None and max_results == 1:
+            left, top, w, h = self.last_rect
+            pad = max(w, h) // 2
+            x0, y0 = max(left - pad, 0), max(top - pad, 0)
+            region = gray[y0:top + h + pad, x0:left + w + pad]
+            qr_codes = self.scan_qr(region) if region.size else []
+            if qr_codes:
+                self.missed_frames = 0
+                yield from self.to_hits(qr_codes, x0, y0, 1, max_results)
+                return
+            self.last_rect = None
+        
+        # Scan at half size (4x fewer pixels); periodically retry at full
+        # size so codes too small for the reduced image are still found
+        full = gray
+        scale = 1
+        if (gray.shape[1] >= self.downscale_min_width and
+                self.missed_frames % self.full_res_every != self.full_res_every - 1):
+            scale = 2
+            gray = cv2.resize(gray, (gray.shape[1] // 2, gray.shape[0] // 2),
+                              interpolation=cv2.INTER_AREA)
+        
+        # OpenCV locates and usually decodes the code in one native pass;
+        # frames without a code never reach pyzbar, and pyzbar only gets the
+        # crop when OpenCV found a code it could not read
+        if self.detector is not None and max_results != 1:
+            yield from self.decode_multi(gray, scale, max_results)
+            return
+        
+        points = None
+        x0, y0, region = 0, 0, gray
+        if self.detector is not None:
+            data, points, _ = self.detector.detectAndDecode(gray)
+            if points is None and scale == 2:
+                # Codes too small for the half-size image are only located at full size
+                scale, gray = 1, full
+                data, points, _ = self.detector.detectAndDecode(gray)
+            if points is None:
+                self.missed_frames += 1
+                return
+            if data:
+                self.missed_frames = 0
+                qr_code = QRHit(data.encode('utf-8'), 'QRCODE', _points_rect(points))
+                yield from self.to_hits([qr_code], 0, 0, scale, max_results)
+                return
+            x0, y0, region = self.crop_to_points(gray, points)
+        
+        # Decode QR codes in the located region
+        qr_codes = self.scan_qr(region)
+        if not qr_codes and scale == 2:
+            # Half size can blur small modules; retry the same area at full size
+            scale = 1
+            x0, y0, region = 0, 0, full
+            if points is not None:
+                x0, y0, region = self.crop_to_points(full, points * 2)
+            qr_codes = self.scan_qr(region)
+        if not qr_codes:
+            # Thresholding runs once per frame, at the final resolution
+            qr_codes = self.decode_binarized(region)
+        if not qr_codes and points is not None:
+            # The locator saw a code pyzbar couldn't read; work harder on the crop
+            qr_codes = self.decode_enhanced(region)
+        self.missed_frames = 0 if qr_codes else self.missed_frames + 1
+        
+        yield from self.to_hits(qr_codes, x0, y0, scale, max_results)
+    
+    def decode_multi(self, gray, scale, max_results):
+        """
+        Decode every QR code in a frame, for scans allowing more than one.
+        
+        OpenCV's multi-code detector reads most codes; pyzbar only scans the
+        whole image when OpenCV located a code it could not read.
+        
+        Args:
+            gray: Grayscale image, possibly downscaled
+            scale (int): Factor from gray to the full frame
+            max_results (int): Keep at most this many codes (None for all)
+            
+        Returns:
+            list: QRHits in full-frame coordinates
+        """
+        found, decoded, points, _ = self.detector.detectAndDecodeMulti(gray)
+        if not found:
+            self.missed_frames += 1
+            return []
+        
+        qr_codes = [QRHit(data.encode('utf-8'), 'QRCODE', _points_rect(corners))
+                    for data, corners in zip(decoded, points) if data]
+        if len(qr_codes) < len(decoded):
+            seen = {qr_code.data for qr_code in qr_codes}
+            qr_codes += [qr_code for qr_code in self.scan_qr(gray) or self.decode_binarized(gray)
+                         if qr_code.data not in seen]
+        self.missed_frames = 0 if qr_codes else self.missed_frames + 1
+        return self.to_hits(qr_codes, 0, 0, scale, max_results)
+    
+    def to_hits(self, qr_codes, x0, y0, scale, max_results):
+        """
+        Map decoded codes back to full-frame coordinates.
+        
+        Args:
+            qr_codes (list): Codes decoded from a crop
+            x0, y0 (int): Crop offset in the scanned image
+            scale (int): Factor from the scanned image to the full frame
+            max_results (int): Keep at most this many codes (None for all)
+            
+        Returns:
+            list: QRHits; the first one's rect is kept for tracking
+        """
+        hits = []
+        for qr_code in qr_codes[:max_results]:
+            rect = qr_code.rect
+            hits.append(QRHit(qr_code.data, qr_code.type,
+                              Rect((rect.left + x0) * scale, (rect.top + y0) * scale,
+                                   rect.width * scale, rect.height * scale)))
+        if hits:
+            self.last_rect = hits[0].rect
+        return hits
+    
+    def should_process_qr(self, qr_data):
+        """
+        Check if we should process this QR code (debounce logic).
+        
+        Args:
+            qr_data (bytes): Raw QR code payload
+            
+        Returns:
+            bool: True if should process, False otherwise
+        """
+        # Monotonic clock: immune to wall-clock jumps from NTP syncs;
+        # integer nanoseconds keep the comparison free of float objects
+        now_ns = time.monotonic_ns()
+        qr_hash = hash(qr_data)
+        
+        # If it's the same QR code and within debounce time, skip
+        if (self.last_qr_hash == qr_hash and 
+            now_ns - self.last_qr_time_ns < self.debounce_ns):
+            return False
+            
+        self.last_qr_hash = qr_hash
+        self.last_qr_time_ns = now_ns
+        return True
+    
+    def start_pipeline(self):
+        """Start the reader and decoder threads on the current camera."""
+        # Capture, decode and output each run on their own thread, so the
+        # next frame is read while this one is decoded and printed
+        self.reader = CameraReader(self.cap, flush=self.queues_frames())
+        decode = functools.partial(self.decode_qr_codes, max_results=self.max_results)
+        self.decoder = DecodeWorker(self.reader, decode, self.target_fps)
+        self.reader.start()
+        self.decoder.start()
+    
+    def queues_frames(self):
+        """Check whether the capture backend may hand back stale queued frames."""
+        # GStreamer's appsink already drops them and picamera2 has no such queue
+        try:
+            return self.cap.getBackendName() == 'V4L2'
+        except Exception:
+            return False
+    
+    def stop_pipeline(self):
+        """
+        Stop the decoder and reader threads, if running.
+        
+        Returns:
+            bool: True once both have exited and the capture is free to release
+        """
+        if self.decoder:
+            self.decoder.stop()
+        if self.reader:
+            self.reader.stop()
+        
+        # A grab() on a failing camera can block for several seconds; the
+        # reader only sees the stop request after it returns
+        if self.decoder:
+            self.decoder.join(timeout=10.0)
+            if not self.decoder.is_alive():
+                self.decoder = None
+        if self.reader:
+            self.reader.join(timeout=10.0)
+            if not self.reader.is_alive():
+                self.reader = None
+        return self.decoder is None and self.reader is None
+    
+    def cleanup(self):
+        """Clean up resources."""
+        if not self.stop_pipeline():
+            # Releasing under a thread still inside grab() can crash the driver
+            print("Camera thread did not stop; leaving the capture open")
+        elif self.cap:
+            self.cap.release()
+        cv2.destroyAllWindows()
+        print("Camera resources released.")
@@ -5,27 +5,20 @@ Lightweight script that uses the camera to detect and print QR code content.
 """
 
 import cv2
-import time
-from pyzbar import pyzbar
+import queue
 
+from qr_pipeline import QRScannerBase
 
-class QRScanner:
-    def __init__(self, camera_index=0):
-        """
-        Initialize the QR scanner with camera.
-        
-        Args:
-            camera_index (int): Camera index (usually 0 for RPi camera)
-        """
-        self.camera_index = camera_index
-        self.cap = None
-        self.last_qr_data = None
-        self.last_qr_time = 0
-        self.debounce_time = 2  # Prevent duplicate reads within 2 seconds
-        
+
+class QRScanner(QRScannerBase):
     def start_camera(self):
         """Initialize the camera capture."""
+        # picamera2 hands over YUV420 directly, with no BGR conversion at all
+        if self.start_picamera2(640, 480):
+            return True
+        
         try:
+            self.raw_yuyv = False
             self.cap = cv2.VideoCapture(self.camera_index)
             if not self.cap.isOpened():
                 raise RuntimeError("Could not open camera")
@@ -34,6 +27,21 @@ class QRScanner:
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             self.cap.set(cv2.CAP_PROP_FPS, 15)  # Lower FPS for better performance
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Don't queue stale frames
+            
+            # Request raw YUYV so the Y plane can be used without a BGR round-trip
+            yuyv = cv2.VideoWriter_fourcc(*'YUYV')
+            self.cap.set(cv2.CAP_PROP_FOURCC, yuyv)
+            if int(self.cap.get(cv2.CAP_PROP_FOURCC)) == yuyv:
+                self.raw_yuyv = self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            
+            self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            
+            # Check one frame here so the decode loop only has to test `ret`
+            ret, frame = self.cap.read()
+            if not ret or frame is None or frame.size == 0:
+                raise RuntimeError("Camera returned no frame")
             
             print("Camera initialized successfully")
             return True
@@ -42,57 +50,6 @@ class QRScanner:
             print(f"Error initializing camera: {e}")
             return False
     
-    def decode_qr_codes(self, frame):
-        """
-        Decode QR codes from the given frame.
-        
-        Args:
-            frame: OpenCV frame/image
-            
-        Returns:
-            list: List of decoded QR code data
-        """
-        # Convert to grayscale for better QR detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect and decode QR codes
-        qr_codes = pyzbar.decode(gray)
-        
-        decoded_data = []
-        for qr_code in qr_codes:
-            # Extract the QR code data
-            qr_data = qr_code.data.decode('utf-8')
-            qr_type = qr_code.type
-            
-            decoded_data.append({
-                'data': qr_data,
-                'type': qr_type,
-                'rect': qr_code.rect
-            })
-            
-        return decoded_data
-    
-    def should_process_qr(self, qr_data):
-        """
-        Check if we should process this QR code (debounce logic).
-        
-        Args:
-            qr_data (str): QR code data
-            
-        Returns:
-            bool: True if should process, False otherwise
-        """
-        current_time = time.time()
-        
-        # If it's the same QR code and within debounce time, skip
-        if (self.last_qr_data == qr_data and 
-            current_time - self.last_qr_time < self.debounce_time):
-            return False
-            
-        self.last_qr_data = qr_data
-        self.last_qr_time = current_time
-        return True
-    
     def run(self):
         """Main scanning loop."""
         if not self.start_camera():
@@ -102,42 +59,40 @@ class QRScanner:
         print("Point the camera at a QR code to scan it.")
         print("-" * 50)
         
+        self.start_pipeline()
+        
         try:
             while True:
-                # Capture frame from camera
-                ret, frame = self.cap.read()
+                # Wait for the decoder thread to finish a frame
+                try:
+                    ret, qr_codes = self.decoder.results.get(timeout=1.0)
+                except queue.Empty:
+                    # A dead worker thread would otherwise leave this waiting forever
+                    if not (self.reader.is_alive() and self.decoder.is_alive()):
+                        print("Camera pipeline stopped unexpectedly")
+                        break
+                    continue
                 if not ret:
                     print("Failed to capture frame")
                     break
                 
-                # Decode QR codes in the frame
-                qr_codes = self.decode_qr_codes(frame)
-                
                 # Process each detected QR code
                 for qr_info in qr_codes:
-                    qr_data = qr_info['data']
+                    qr_data = qr_info.data
                     
                     if self.should_process_qr(qr_data):
+                        # Only payloads that pass the debounce get decoded
+                        qr_data = qr_data.decode('utf-8', errors='replace')
                         print(f"QR Code detected!")
-                        print(f"Type: {qr_info['type']}")
+                        print(f"Type: {qr_info.type}")
                         print(f"Content: {qr_data}")
                         print("-" * 50)
                 
-                # Small delay to prevent excessive CPU usage
-                time.sleep(0.1)
-                
         except KeyboardInterrupt:
             print("\nStopping QR scanner...")
         
         finally:
             self.cleanup()
-    
-    def cleanup(self):
-        """Clean up resources."""
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
-        print("Camera resources released.")
 
 
 def main():
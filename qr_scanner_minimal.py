@@ -8,10 +8,14 @@ import sys
 import time
 import subprocess
 import tempfile
+import shutil
+import threading
+import collections
 import os
 
 try:
     import cv2
+    import numpy as np
 except ImportError:
     print("Error: OpenCV not found!")
     print("Please install: sudo apt install python3-opencv")
@@ -19,18 +23,101 @@ except ImportError:
 
 try:
     from pyzbar import pyzbar
+    from pyzbar.locations import Rect
+    from pyzbar.pyzbar import ZBarSymbol
 except ImportError:
     print("Error: pyzbar not found!")
     print("Please install: pip install pyzbar")
     sys.exit(1)
 
+try:
+    import zbar
+except ImportError:
+    zbar = None  # Fall back to pyzbar for every scan
+
+
+# Only look for QR codes; skips zbar's linear barcode scanners
+QR_SYMBOLS = [ZBarSymbol.QRCODE]
+
+# One decoded QR code (data is raw bytes); a tuple is much cheaper to build than a dict
+QRHit = collections.namedtuple('QRHit', 'data type rect')
+
+
+class _MJPEGStreamReader(threading.Thread):
+    """Background thread that keeps the newest complete JPEG from an MJPEG pipe."""
+
+    def __init__(self, stream):
+        """
+        Initialize the reader thread.
+        
+        Args:
+            stream: Unbuffered binary stream carrying concatenated JPEG frames
+        """
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.jpeg = None
+        self.new = threading.Event()
+    
+    def run(self):
+        """Split the stream on JPEG EOI markers, keeping only the last frame."""
+        buf = b''
+        while True:
+            chunk = self.stream.read(65536)
+            if not chunk:
+                break
+            buf += chunk
+            
+            end = buf.rfind(b'\xff\xd9')
+            if end == -1:
+                continue
+            # The last complete frame starts after the previous EOI
+            prev_end = buf.rfind(b'\xff\xd9', 0, end)
+            start = buf.find(b'\xff\xd8', prev_end + 2 if prev_end != -1 else 0, end)
+            if start != -1:
+                with self.lock:
+                    self.jpeg = buf[start:end + 2]
+                    self.new.set()
+            buf = buf[end + 2:]
+
 
 class MinimalQRScanner:
     def __init__(self):
-        self.last_qr_data = None
-        self.last_qr_time = 0
-        self.debounce_time = 2
-        self.temp_dir = tempfile.mkdtemp()
+        self.last_qr_hash = None
+        self.last_qr_time_ns = 0
+        self.debounce_ns = 2_000_000_000  # Integer nanoseconds, no float boxing
+        self.scan_period = 1.0  # Target seconds between scan starts
+        self.max_results = 1  # QR codes reported per scan
+        self.width = 640
+        self.height = 480
+        
+        # QR-only zbar scanner configured once, when the bindings exist
+        self.zbar_scanner = None
+        if zbar is not None:
+            self.zbar_scanner = zbar.ImageScanner()
+            self.zbar_scanner.parse_config('disable')
+            self.zbar_scanner.parse_config('qrcode.enable')
+        
+        # 8x8 thumbnail gate: skip scans of an unchanged scene
+        self.last_tiny = None
+        self.tiny_tolerance = 4  # Max per-cell brightness change still "same"
+        self.static_scans = 0
+        self.max_static_scans = 5  # Force a scan after this many skips
+        
+        # Keep captures in RAM (tmpfs) rather than on the SD card
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.temp_dir = tempfile.mkdtemp(dir=shm_dir)
+        
+        # Probe camera tools once; remember which one works
+        self.tools = self.check_camera_tools()
+        self.capture_commands = self.build_capture_commands()
+        self.preferred_tool = None
+        self.failed_tools = set()
+        
+        # Persistent libcamera-vid process, when available
+        self.stream_proc = None
+        self.stream_reader = None
+        self.stream_live = False  # True once the stream delivered a frame
         
     def check_camera_tools(self):
         """Check what camera tools are available."""
@@ -38,16 +125,12 @@ class MinimalQRScanner:
             'raspistill': False,
             'libcamera-still': False,
             'fswebcam': False,
-            'ffmpeg': False
+            'ffmpeg': False,
+            'libcamera-vid': False
         }
         
         for tool in tools.keys():
-            try:
-                result = subprocess.run(['which', tool], 
-                                      capture_output=True, text=True)
-                tools[tool] = result.returncode == 0
-            except:
-                pass
+            tools[tool] = shutil.which(tool) is not None
         
         print("Available camera tools:")
         for tool, available in tools.items():
@@ -56,151 +139,251 @@ class MinimalQRScanner:
         
         return tools
     
-    def capture_image_raspistill(self, output_path):
-        """Capture image using raspistill (legacy camera stack)."""
+    def start_stream(self):
+        """Start libcamera-vid once, streaming MJPEG frames over a pipe."""
+        if not self.tools.get('libcamera-vid', False):
+            return False
+        
         try:
             cmd = [
-                'raspistill',
-                '-t', '1',  # 1ms timeout (immediate capture)
-                '-w', '640',  # width
-                '-h', '480',  # height
-                '-q', '75',   # quality
-                '-o', output_path,
+                'libcamera-vid',
+                '-t', '0',  # run until stopped
+                '--codec', 'mjpeg',
+                '--width', str(self.width),
+                '--height', str(self.height),
+                '--framerate', '10',
+                '-o', '-',  # frames to stdout
                 '--nopreview'
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0 and os.path.exists(output_path)
+            self.stream_proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL, bufsize=0)
+            self.stream_reader = _MJPEGStreamReader(self.stream_proc.stdout)
+            self.stream_reader.start()
+            self.stream_live = False
+            print("Streaming frames from libcamera-vid")
+            return True
             
         except Exception as e:
-            print(f"raspistill error: {e}")
+            print(f"libcamera-vid error: {e}")
+            self.stream_proc = None
             return False
     
-    def capture_image_libcamera(self, output_path):
-        """Capture image using libcamera-still (new camera stack)."""
-        try:
-            cmd = [
+    def stop_stream(self):
+        """Stop the libcamera-vid process, if running."""
+        if self.stream_proc:
+            self.stream_proc.terminate()
+            try:
+                self.stream_proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.stream_proc.kill()
+            self.stream_proc = None
+            self.stream_reader = None
+    
+    def capture_stream_frame(self):
+        """Return the newest streamed frame as grayscale, or None."""
+        # libcamera-vid takes a few seconds to deliver its first frame
+        timeout = 2.0 if self.stream_live else 10.0
+        if not self.stream_reader.new.wait(timeout):
+            return None
+        # Clear and pop under the reader's lock so a frame is never handed out twice
+        with self.stream_reader.lock:
+            self.stream_reader.new.clear()
+            jpeg = self.stream_reader.jpeg
+            self.stream_reader.jpeg = None
+        if jpeg is None:
+            return None
+        self.stream_live = True
+        
+        # Decode only the luma channel straight from memory
+        return cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+    
+    def build_capture_commands(self):
+        """
+        Build the argv of every available one-shot capture tool.
+        
+        Returns:
+            list: (tool name, argv, output path) tuples in order of preference
+        """
+        # Each tool overwrites the same file in place on every scan. Raw tools
+        # write a .yuv file whose first width*height bytes are luma
+        yuv_path = os.path.join(self.temp_dir, 'capture.yuv')
+        jpg_path = os.path.join(self.temp_dir, 'capture.jpg')
+        
+        commands = [
+            # libcamera-still (new camera stack)
+            ('libcamera-still', [
                 'libcamera-still',
                 '-t', '1',  # 1ms timeout
-                '--width', '640',
-                '--height', '480',
-                '--quality', '75',
-                '-o', output_path,
+                '--width', str(self.width),
+                '--height', str(self.height),
+                '--encoding', 'yuv420',  # raw planar YUV, luma plane first
+                '-o', yuv_path,
                 '--nopreview'
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0 and os.path.exists(output_path)
-            
-        except Exception as e:
-            print(f"libcamera-still error: {e}")
-            return False
-    
-    def capture_image_fswebcam(self, output_path):
-        """Capture image using fswebcam."""
-        try:
-            cmd = [
+            ], yuv_path),
+            # raspistill (legacy camera stack)
+            ('raspistill', [
+                'raspistill',
+                '-t', '1',  # 1ms timeout (immediate capture)
+                '-w', str(self.width),
+                '-h', str(self.height),
+                '-q', '75',   # quality
+                '-o', jpg_path,
+                '--nopreview'
+            ], jpg_path),
+            ('fswebcam', [
                 'fswebcam',
                 '-d', '/dev/video0',
-                '-r', '640x480',
+                '-r', f'{self.width}x{self.height}',
                 '--no-banner',
-                '--save', output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0 and os.path.exists(output_path)
-            
-        except Exception as e:
-            print(f"fswebcam error: {e}")
-            return False
-    
-    def capture_image_ffmpeg(self, output_path):
-        """Capture image using ffmpeg."""
-        try:
-            cmd = [
+                '--save', jpg_path
+            ], jpg_path),
+            ('ffmpeg', [
                 'ffmpeg',
                 '-f', 'v4l2',
                 '-i', '/dev/video0',
                 '-vframes', '1',
-                '-s', '640x480',
+                '-s', f'{self.width}x{self.height}',
+                '-pix_fmt', 'gray',  # raw 8-bit luma only
+                '-f', 'rawvideo',
                 '-y',  # overwrite output file
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0 and os.path.exists(output_path)
+                yuv_path
+            ], yuv_path),
+        ]
+        
+        return [command for command in commands if self.tools.get(command[0], False)]
+    
+    def run_capture_command(self, tool_name, argv):
+        """Run a prebuilt capture command; its output is not needed."""
+        try:
+            # Output files are reused between scans, so the exit status is
+            # the only reliable sign that this capture produced a new image
+            result = subprocess.run(argv, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, timeout=10)
+            return result.returncode == 0
             
         except Exception as e:
-            print(f"ffmpeg error: {e}")
+            print(f"{tool_name} error: {e}")
             return False
     
     def capture_image(self):
         """Try to capture an image using available tools."""
-        tools = self.check_camera_tools()
-        output_path = os.path.join(self.temp_dir, 'capture.jpg')
+        capture_commands = self.capture_commands
         
-        # Try tools in order of preference
-        capture_methods = [
-            ('libcamera-still', self.capture_image_libcamera),
-            ('raspistill', self.capture_image_raspistill),
-            ('fswebcam', self.capture_image_fswebcam),
-            ('ffmpeg', self.capture_image_ffmpeg)
-        ]
+        # The tool that worked last time goes first
+        if self.preferred_tool:
+            capture_commands = sorted(capture_commands,
+                                      key=lambda command: command[0] != self.preferred_tool)
         
-        for tool_name, capture_func in capture_methods:
-            if tools.get(tool_name, False):
-                print(f"Trying {tool_name}...")
-                if capture_func(output_path):
+        candidates = [command for command in capture_commands
+                      if command[0] not in self.failed_tools]
+        if not candidates:
+            # Every tool has failed at some point; give them all another chance
+            self.failed_tools.clear()
+            candidates = capture_commands
+        
+        for tool_name, argv, output_path in candidates:
+            if self.run_capture_command(tool_name, argv):
+                if tool_name != self.preferred_tool:
                     print(f"✓ Successfully captured image with {tool_name}")
-                    return output_path
-                else:
-                    print(f"✗ {tool_name} failed")
+                    self.preferred_tool = tool_name
+                return output_path
             else:
-                print(f"✗ {tool_name} not available")
+                print(f"✗ {tool_name} failed")
+                self.failed_tools.add(tool_name)
+                if tool_name == self.preferred_tool:
+                    self.preferred_tool = None
         
         return None
     
-    def decode_qr_codes_from_file(self, image_path):
-        """Decode QR codes from image file."""
+    def capture_frame(self):
+        """Capture a grayscale frame from the stream or a one-shot tool."""
+        if self.stream_proc:
+            if self.stream_proc.poll() is None:
+                # libcamera-vid still holds the camera, so one-shot tools would
+                # fail; a late or undecodable frame is simply retried next scan
+                return self.capture_stream_frame()
+            print("libcamera-vid exited, falling back to one-shot capture")
+            self.stop_stream()
+        
+        image_path = self.capture_image()
+        if not image_path:
+            return None
+        
+        # The file stays in place; the next capture overwrites it
+        return self.load_image(image_path)
+    
+    def load_image(self, image_path):
+        """Load a captured image file as grayscale."""
         try:
-            # Load image with OpenCV
-            image = cv2.imread(image_path)
-            if image is None:
-                return []
+            if image_path.endswith('.yuv'):
+                # Raw capture: the luma plane is used as-is, no codec involved
+                pixels = self.width * self.height
+                luma = np.fromfile(image_path, dtype=np.uint8, count=pixels)
+                if luma.size < pixels:
+                    return None
+                return luma.reshape(self.height, self.width)
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            # Decode only the luma channel of the JPEG; no BGR image is built
+            return cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
             
-            # Decode QR codes
-            qr_codes = pyzbar.decode(gray)
+        except Exception as e:
+            print(f"Error loading image: {e}")
+            return None
+    
+    def scan_qr(self, gray):
+        """Run the QR-only zbar scanner on a grayscale image, via pyzbar if needed."""
+        if self.zbar_scanner is None:
+            return pyzbar.decode(gray, symbols=QR_SYMBOLS)
+        
+        h, w = gray.shape
+        zimg = zbar.Image(w, h, 'Y800', gray.tobytes())
+        self.zbar_scanner.scan(zimg)
+        qr_codes = []
+        for symbol in zimg.symbols:
+            data = symbol.data
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            xs = [x for x, _ in symbol.location]
+            ys = [y for _, y in symbol.location]
+            rect = Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+            qr_codes.append(QRHit(data, str(symbol.type), rect))
+        return qr_codes
+    
+    def decode_qr_codes(self, gray, max_results=None):
+        """Decode QR codes from a grayscale image, yielding up to max_results QRHits."""
+        try:
+            # 64 bytes summarize the scene; near-equal means nothing new to read
+            tiny = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+            if (self.last_tiny is not None and self.static_scans < self.max_static_scans and
+                    cv2.absdiff(tiny, self.last_tiny).max() <= self.tiny_tolerance):
+                self.static_scans += 1
+                return
+            self.last_tiny = tiny
+            self.static_scans = 0
             
-            decoded_data = []
-            for qr_code in qr_codes:
-                qr_data = qr_code.data.decode('utf-8')
-                qr_type = qr_code.type
-                
-                decoded_data.append({
-                    'data': qr_data,
-                    'type': qr_type,
-                    'rect': qr_code.rect
-                })
+            # Decode QR codes
+            qr_codes = self.scan_qr(gray)
             
-            return decoded_data
+            for qr_code in qr_codes[:max_results]:
+                yield QRHit(qr_code.data, qr_code.type, qr_code.rect)
             
         except Exception as e:
             print(f"Error decoding QR codes: {e}")
-            return []
     
     def should_process_qr(self, qr_data):
         """Check if we should process this QR code (debounce logic)."""
-        current_time = time.time()
+        # Monotonic clock: immune to wall-clock jumps from NTP syncs;
+        # integer nanoseconds keep the comparison free of float objects
+        now_ns = time.monotonic_ns()
+        qr_hash = hash(qr_data)
         
-        if (self.last_qr_data == qr_data and 
-            current_time - self.last_qr_time < self.debounce_time):
+        if (self.last_qr_hash == qr_hash and 
+            now_ns - self.last_qr_time_ns < self.debounce_ns):
             return False
             
-        self.last_qr_data = qr_data
-        self.last_qr_time = current_time
+        self.last_qr_hash = qr_hash
+        self.last_qr_time_ns = now_ns
         return True
     
     def run(self):
@@ -209,9 +392,8 @@ class MinimalQRScanner:
         print("Using external camera tools instead of OpenCV capture")
         print("=" * 60)
         
-        # Check available tools
-        tools = self.check_camera_tools()
-        if not any(tools.values()):
+        # Tools were probed once in __init__
+        if not any(self.tools.values()):
             print("\nNo camera tools available!")
             print("Install one of these:")
             print("  sudo apt install fswebcam")
@@ -219,6 +401,9 @@ class MinimalQRScanner:
             print("Or enable camera in raspi-config")
             return
         
+        # One long-lived camera process instead of a new one per scan
+        self.start_stream()
+        
         print(f"\nScanning for QR codes...")
         print("Press Ctrl+C to exit")
         print("-" * 40)
@@ -227,39 +412,39 @@ class MinimalQRScanner:
         
         try:
             while True:
+                scan_start = time.monotonic()
                 scan_count += 1
                 print(f"Scan {scan_count}...", end=" ")
                 
                 # Capture image
-                image_path = self.capture_image()
-                if not image_path:
+                gray = self.capture_frame()
+                if gray is None:
                     print("capture failed")
                     time.sleep(2)
                     continue
                 
                 # Decode QR codes
-                qr_codes = self.decode_qr_codes_from_file(image_path)
+                qr_codes = list(self.decode_qr_codes(gray, self.max_results))
                 
                 if qr_codes:
                     print(f"found {len(qr_codes)} QR code(s)!")
                     for qr_info in qr_codes:
-                        qr_data = qr_info['data']
+                        qr_data = qr_info.data
                         if self.should_process_qr(qr_data):
+                            # Only payloads that pass the debounce get decoded
+                            qr_data = qr_data.decode('utf-8', errors='replace')
                             print(f"\n🎯 QR Code Content:")
-                            print(f"   Type: {qr_info['type']}")
+                            print(f"   Type: {qr_info.type}")
                             print(f"   Data: {qr_data}")
                             print("-" * 40)
                 else:
                     print("no QR codes found")
                 
-                # Clean up image file
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
-                
-                # Wait before next scan
-                time.sleep(1)
+                # Wait only for what is left of the scan period, so slow
+                # captures don't stretch the interval between scans
+                sleep_for = self.scan_period - (time.monotonic() - scan_start)
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
                 
         except KeyboardInterrupt:
             print("\n\nStopping QR scanner...")
@@ -268,9 +453,9 @@ class MinimalQRScanner:
             self.cleanup()
     
     def cleanup(self):
-        """Clean up temporary files."""
+        """Stop the camera stream and clean up temporary files."""
+        self.stop_stream()
         try:
-            import shutil
             shutil.rmtree(self.temp_dir)
         except:
             pass
@@ -7,25 +7,42 @@ Uses system OpenCV to avoid heavy pip installations.
 import sys
 import time
 import os
+import functools
+import queue
 
 # Check if we can import cv2 from system packages
 try:
     import cv2
+    import numpy
 except ImportError:
     print("Error: OpenCV not found!")
     print("Please install system OpenCV: sudo apt install python3-opencv")
     sys.exit(1)
 
 try:
-    from pyzbar import pyzbar
+    import pyzbar.pyzbar
 except ImportError:
     print("Error: pyzbar not found!")
     print("Please install: pip install pyzbar (in virtual environment)")
     print("Or try: sudo apt install python3-pyzbar")
     sys.exit(1)
 
+from qr_pipeline import QRScannerBase
 
-class QRScanner:
+
+# VideoCapture settings tried after GStreamer, most tuned first:
+# (backend, fourcc, width, height, fps); None keeps the driver default
+CAPTURE_ATTEMPTS = [
+    # Direct V4L2, very low resolution for the Zero 2 W's memory
+    (cv2.CAP_V4L2, 'YUYV', 160, 120, 5),
+    # Basic OpenCV with minimal settings
+    (cv2.CAP_ANY, None, 320, 240, None),
+    # Legacy mode: no settings at all
+    (cv2.CAP_ANY, None, None, None, None),
+]
+
+
+class QRScanner(QRScannerBase):
     def __init__(self, camera_index=0):
         """
         Initialize the QR scanner with camera.
@@ -33,14 +50,16 @@ class QRScanner:
         Args:
             camera_index (int): Camera index (usually 0 for RPi camera)
         """
-        self.camera_index = camera_index
-        self.cap = None
-        self.last_qr_data = None
-        self.last_qr_time = 0
-        self.debounce_time = 2  # Prevent duplicate reads within 2 seconds
+        super().__init__(camera_index)
+        self.cap_key = None  # (source, backend) of self.cap while reusable
+        self.video_devices = None  # Cached /dev/video* scan
+        self.working_approach = None  # (device, approach) that last opened
         
     def check_camera_devices(self):
-        """Check available camera devices."""
+        """Check available camera devices, scanning /dev only until one is found."""
+        if self.video_devices:
+            return self.video_devices
+        
         print("Checking available camera devices...")
         
         # Check for video devices
@@ -59,11 +78,32 @@ class QRScanner:
             print("3. Try: sudo modprobe bcm2835-v4l2")
             return video_devices
         
+        self.video_devices = video_devices
         return video_devices
         
     def start_camera(self):
         """Initialize the camera capture."""
+        # picamera2 maps the ISP's YUV420 buffers; no V4L2 copy or BGR conversion
+        if self.start_picamera2(320, 240, buffer_count=3):
+            return True
+        
         try:
+            # Only reuse captures opened during this probe
+            self.cap_key = None
+            
+            # Approaches tried per device: a GStreamer appsink that drops stale
+            # frames, then plain VideoCapture with each CAPTURE_ATTEMPTS entry
+            approaches = [self._try_gstreamer] + [
+                functools.partial(self._try_capture, attempt)
+                for attempt in CAPTURE_ATTEMPTS]
+            
+            # On recovery, reopen the way that worked instead of re-probing
+            if self.working_approach is not None:
+                device_idx, i = self.working_approach
+                print(f"\nReopening /dev/video{device_idx} with approach {i+1}...")
+                if self._open_with(approaches[i], device_idx, i):
+                    return True
+            
             # Check available devices first
             available_devices = self.check_camera_devices()
             if not available_devices:
@@ -75,23 +115,11 @@ class QRScanner:
             for device_idx in devices_to_try:
                 print(f"\nTrying device /dev/video{device_idx}...")
                 
-                # Try different approaches for this device
-                approaches = [
-                    # Approach 1: Direct V4L2 with specific settings
-                    lambda idx: self._try_v4l2_direct(idx),
-                    # Approach 2: Basic OpenCV with minimal settings
-                    lambda idx: self._try_basic_opencv(idx),
-                    # Approach 3: Legacy mode
-                    lambda idx: self._try_legacy_mode(idx),
-                ]
-                
                 for i, approach in enumerate(approaches):
                     print(f"  Approach {i+1}...")
-                    if approach(device_idx):
-                        print(f"  Success with approach {i+1}!")
+                    if self._open_with(approach, device_idx, i):
                         return True
-                    else:
-                        print(f"  Approach {i+1} failed")
+                    print(f"  Approach {i+1} failed")
             
             print("All camera initialization attempts failed")
             return False
@@ -100,165 +128,144 @@ class QRScanner:
             print(f"Error initializing camera: {e}")
             return False
     
-    def _try_v4l2_direct(self, device_idx):
-        """Try V4L2 backend with specific settings."""
-        try:
-            # Release any existing capture
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-            
-            # Create capture with V4L2 backend
-            self.cap = cv2.VideoCapture(device_idx, cv2.CAP_V4L2)
-            
-            if not self.cap.isOpened():
-                return False
-            
-            # Set very conservative settings for RPi Zero 2 W
-            settings_applied = 0
-            
-            # Try to set resolution (very low for memory constraints)
-            if self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 160):
-                settings_applied += 1
-            if self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 120):
-                settings_applied += 1
-            if self.cap.set(cv2.CAP_PROP_FPS, 5):
-                settings_applied += 1
-            if self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
-                settings_applied += 1
-            
-            # Try to set pixel format to YUYV (common and efficient)
-            try:
-                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('Y', 'U', 'Y', 'V'))
-            except:
-                pass
-            
-            print(f"    Applied {settings_applied}/4 camera settings")
-            
-            # Test if we can read frames
-            for attempt in range(3):
-                ret, frame = self.cap.read()
-                if ret and frame is not None and frame.size > 0:
-                    print(f"    Frame test successful (size: {frame.shape})")
-                    return True
-                time.sleep(0.1)
-            
-            return False
+    def _open_with(self, approach, device_idx, index):
+        """
+        Open the camera with one approach and record the frame geometry.
+        
+        Args:
+            approach: Callable taking the device index, True on success
+            device_idx (int): Video device index
+            index (int): Position of the approach, remembered for recovery
             
-        except Exception as e:
-            print(f"    V4L2 approach error: {e}")
-            return False
-    
-    def _try_basic_opencv(self, device_idx):
-        """Try basic OpenCV approach."""
+        Returns:
+            bool: True if the camera opened
+        """
+        self.raw_yuyv = False
         try:
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-            
-            # Simple OpenCV capture
-            self.cap = cv2.VideoCapture(device_idx)
-            
-            if not self.cap.isOpened():
-                return False
-            
-            # Minimal settings
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
-            # Test frame capture
-            ret, frame = self.cap.read()
-            if ret and frame is not None:
-                print(f"    Basic OpenCV successful (size: {frame.shape})")
-                return True
-            
-            return False
-            
+            opened = approach(device_idx)
         except Exception as e:
-            print(f"    Basic OpenCV error: {e}")
-            return False
-    
-    def _try_legacy_mode(self, device_idx):
-        """Try legacy compatibility mode."""
-        try:
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-            
-            # Try with CAP_ANY and no initial settings
-            self.cap = cv2.VideoCapture(device_idx, cv2.CAP_ANY)
-            
-            if not self.cap.isOpened():
-                return False
-            
-            # Test without setting any properties first
-            ret, frame = self.cap.read()
-            if ret and frame is not None:
-                print(f"    Legacy mode successful (size: {frame.shape})")
-                # Only now try to optimize settings
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                return True
-            
+            # A driver error in one approach must not abort the whole probe
+            print(f"    Approach {index+1} error: {e}")
+            self.cap_key = None
             return False
-            
-        except Exception as e:
-            print(f"    Legacy mode error: {e}")
+        if not opened:
             return False
+        
+        print(f"  Success with approach {index+1}!")
+        self.working_approach = (device_idx, index)
+        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return True
     
-    def decode_qr_codes(self, frame):
+    def _reset_cap(self, source, backend):
         """
-        Decode QR codes from the given frame.
+        Get a VideoCapture for a source, reusing the open one when it matches.
+        
+        Some OpenCV builds leak memory on every VideoCapture create/release,
+        so a capture still open on the same source and backend is
+        reconfigured by the next attempt instead of being replaced.
         
         Args:
-            frame: OpenCV frame/image
+            source: Device index or GStreamer pipeline string
+            backend (int): cv2.CAP_* backend
             
         Returns:
-            list: List of decoded QR code data
+            cv2.VideoCapture: The capture now in self.cap (may not be opened)
         """
-        try:
-            # Convert to grayscale for better QR detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detect and decode QR codes
-            qr_codes = pyzbar.decode(gray)
-            
-            decoded_data = []
-            for qr_code in qr_codes:
-                # Extract the QR code data
-                qr_data = qr_code.data.decode('utf-8')
-                qr_type = qr_code.type
+        if self.cap is not None and self.cap_key == (source, backend):
+            return self.cap
+        
+        if self.cap:
+            self.cap.release()
+        self.cap = None
+        self.cap_key = None
+        self.cap = cv2.VideoCapture(source, backend)
+        if self.cap.isOpened():
+            self.cap_key = (source, backend)
+        return self.cap
+    
+    def _try_gstreamer(self, device_idx):
+        """Try a GStreamer pipeline that delivers only the newest GRAY8 frame."""
+        # appsink max-buffers=1 drop=true discards stale frames instead of
+        # queueing them behind a slow decode; GRAY8 output skips cvtColor
+        sink = "video/x-raw,format=GRAY8 ! appsink max-buffers=1 drop=true sync=false"
+        pipelines = [
+            # libcamera-based camera stack
+            f"libcamerasrc ! video/x-raw,width=320,height=240 ! videoconvert ! {sink}",
+            # V4L2 device producing MJPEG
+            f"v4l2src device=/dev/video{device_idx} ! image/jpeg,width=320,height=240,framerate=15/1 "
+            f"! jpegdec ! videoconvert ! {sink}",
+        ]
+        
+        for pipeline in pipelines:
+            try:
+                if not self._reset_cap(pipeline, cv2.CAP_GSTREAMER).isOpened():
+                    continue
                 
-                decoded_data.append({
-                    'data': qr_data,
-                    'type': qr_type,
-                    'rect': qr_code.rect
-                })
+                ret, frame = self.cap.read()
+                if ret and frame is not None:
+                    print(f"    GStreamer successful (size: {frame.shape})")
+                    return True
+                self.cap_key = None
                 
-            return decoded_data
-        except Exception as e:
-            print(f"Error decoding QR codes: {e}")
-            return []
+            except Exception as e:
+                print(f"    GStreamer approach error: {e}")
+        
+        return False
     
-    def should_process_qr(self, qr_data):
+    def _try_capture(self, attempt, device_idx):
         """
-        Check if we should process this QR code (debounce logic).
+        Open a VideoCapture with one CAPTURE_ATTEMPTS configuration.
         
         Args:
-            qr_data (str): QR code data
+            attempt (tuple): (backend, fourcc, width, height, fps)
+            device_idx (int): Video device index
             
         Returns:
-            bool: True if should process, False otherwise
+            bool: True if the capture opened and delivered a frame
         """
-        current_time = time.time()
+        backend, fourcc, width, height, fps = attempt
+        if not self._reset_cap(device_idx, backend).isOpened():
+            return False
+        
+        for prop, value in ((cv2.CAP_PROP_FRAME_WIDTH, width),
+                            (cv2.CAP_PROP_FRAME_HEIGHT, height),
+                            (cv2.CAP_PROP_FPS, fps)):
+            if value is not None:
+                self.cap.set(prop, value)
+        if fourcc is not None:
+            code = cv2.VideoWriter_fourcc(*fourcc)
+            self.cap.set(cv2.CAP_PROP_FOURCC, code)
+            # Keep frames as raw YUYV; the Y plane is all pyzbar needs
+            if fourcc == 'YUYV' and int(self.cap.get(cv2.CAP_PROP_FOURCC)) == code:
+                self.raw_yuyv = self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         
-        # If it's the same QR code and within debounce time, skip
-        if (self.last_qr_data == qr_data and 
-            current_time - self.last_qr_time < self.debounce_time):
+        # Test if we can read frames
+        for _ in range(3):
+            ret, frame = self.cap.read()
+            if ret and frame is not None and frame.size > 0:
+                break
+            time.sleep(0.1)
+        else:
+            # A capture that delivers nothing is not worth reconfiguring
+            self.cap_key = None
             return False
-            
-        self.last_qr_data = qr_data
-        self.last_qr_time = current_time
+        
+        # Drivers can silently ignore set(); keep the size they chose rather
+        # than fall through to an attempt without YUYV or the fps cap.
+        # Frame geometry is read back from the capture by _open_with
+        got_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        got_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width is not None and (got_width, got_height) != (width, height):
+            print(f"    Asked for {width}x{height}, using {got_width}x{got_height}")
+        
+        # Only now, so drivers that reject it still get to open
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        buffers = self.cap.get(cv2.CAP_PROP_BUFFERSIZE)
+        print(f"    Frame test successful ({got_width}x{got_height} at "
+              f"{self.cap.get(cv2.CAP_PROP_FPS):g} fps, {buffers:g} buffers)")
+        if buffers != 1:
+            print("    Driver ignored BUFFERSIZE=1; queued V4L2 frames are flushed on read")
         return True
     
     def run(self):
@@ -280,20 +287,33 @@ class QRScanner:
         failed_frames = 0
         max_failed_frames = 10
         
+        self.start_pipeline()
+        
         try:
             while True:
-                # Capture frame from camera
-                ret, frame = self.cap.read()
+                # Wait for the decoder thread to finish a frame
+                try:
+                    ret, qr_codes = self.decoder.results.get(timeout=1.0)
+                except queue.Empty:
+                    # A dead worker thread would otherwise leave this waiting forever
+                    if not (self.reader.is_alive() and self.decoder.is_alive()):
+                        print("Camera pipeline stopped unexpectedly")
+                        break
+                    continue
                 
-                if not ret or frame is None or frame.size == 0:
+                if not ret:
                     failed_frames += 1
                     if failed_frames <= 3:  # Only show first few failures
                         print(f"Failed to capture frame {frame_count} (failed: {failed_frames})")
                     
                     if failed_frames >= max_failed_frames:
                         print(f"Too many failed frames ({failed_frames}), restarting camera...")
+                        if not self.stop_pipeline():
+                            print("Camera thread is stuck, exiting...")
+                            break
                         if self.start_camera():
                             failed_frames = 0
+                            self.start_pipeline()
                             continue
                         else:
                             print("Camera restart failed, exiting...")
@@ -313,34 +333,23 @@ class QRScanner:
                 if frame_count % 50 == 0:
                     print(f"Scanning... (frame {frame_count})")
                 
-                # Decode QR codes in the frame
-                qr_codes = self.decode_qr_codes(frame)
-                
                 # Process each detected QR code
                 for qr_info in qr_codes:
-                    qr_data = qr_info['data']
+                    qr_data = qr_info.data
                     
                     if self.should_process_qr(qr_data):
+                        # Only payloads that pass the debounce get decoded
+                        qr_data = qr_data.decode('utf-8', errors='replace')
                         print(f"\n🎯 QR Code detected!")
-                        print(f"Type: {qr_info['type']}")
+                        print(f"Type: {qr_info.type}")
                         print(f"Content: {qr_data}")
                         print("-" * 50)
                 
-                # Longer delay for RPi Zero 2 W
-                time.sleep(0.2)
-                
         except KeyboardInterrupt:
             print("\nStopping QR scanner...")
         
         finally:
             self.cleanup()
-    
-    def cleanup(self):
-        """Clean up resources."""
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
-        print("Camera resources released.")
 
 
 def main():